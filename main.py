@@ -1,173 +1,319 @@
 #!/usr/bin/env python3
-import os, json, re, fitz
-from langdetect import detect, DetectorFactory, LangDetectException
+import os, re, fitz, unicodedata
+import ahocorasick
+import numpy as np
+import orjson
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import accumulate
+from operator import itemgetter
+from langdetect import DetectorFactory, LangDetectException
+from langdetect.detector_factory import PROFILES_DIRECTORY
+try:
+    import re2
+except ImportError:  # RE2 is optional; fall back to the stdlib engine
+    re2 = None
 
 INPUT_DIR = "input"
 OUTPUT_DIR = "output"
+# COMPACT=1 writes minified JSON for machine consumers instead of pretty-printing
+COMPACT = os.getenv("COMPACT") == "1"
 
-def extract_spans(pdf_path):
-    """Block-level extraction of text spans with metadata from PDF"""
-    doc = fitz.open(pdf_path)
-    spans = []
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        for block in page.get_text("blocks"):
-            if block[6] != 0:
-                continue
-            text = block[4].strip()
-            if not text:
-                continue
-            for line in text.split("\n"):
-                line = line.strip()
-                if not line:
+# Language profiles loaded for detection; a high-coverage subset of langdetect's 55
+DETECT_LANGUAGES = ("en", "es", "ar", "fr", "de", "it", "pt", "ru", "ja", "ko", "zh-cn", "zh-tw", "hi", "bn", "id")
+_detector_factory = None
+
+# Heading patterns, compiled once per category at import (see _compile_patterns)
+_EXCLUDE_PATTERNS = (
+    r'^Page\s+\d+', r'^Copyright', r'^Version\s+\d', r'^\d{4}$',
+    r'^www\.|^http', r'@\w+\.', r'^\d+\s*$', r'^[^\w\s]*$',
+    r'^\([^)]*\)$', r'^[\d\s\-\.]+$',
+    r'^(CLOSED|PLEASE|VISIT|REQUIRED|CLIMBING)',
+    r'.*[.!?]\s+.*[.!?]',
+)
+
+_HEADING_PATTERNS = (
+    r'^\d+\.\s+[A-Z]', r'^\d+\.\d+\s+[A-Z]', r'^\d+\.\d+\.\d+\s+[A-Z]',
+    r'^(Chapter|Section|Part)\s+\d+', r'^Appendix\s+[A-Z]',
+    r'^(Abstract|Introduction|Overview|Summary|Background|Conclusion|References|Bibliography|Acknowledgements?|Table\s+of\s+Contents|Revision\s+History)$',
+    r'^[A-Z][A-Z\s&:-]{6,}$', r'.*:\s*$', r'^Phase\s+[IVX]+:',
+    r'^For\s+(each|the)\s+\w+.*:$', r'^What\s+.*\?$', r'^[A-Z][a-z]+\s+OPTIONS?$',
+    r'^(HOPE|WELCOME|THANK).*$' , r'^[A-Z].*\s+(Library|Digital|Component|Plan)$',
+    r'^Milestones?$', r'^Approach\s+and\s+', r'^Evaluation\s+and\s+', r'^Business\s+Plan',
+    r'^\d+\)\s+[A-Z]', r'^[-*•]\s+[A-Z]', r'^[A-Z][A-Za-z\s\-:&]+[.:]?\s*$',
+)
+
+_H1_PATTERNS = (
+    r'^\d+\.\s+[A-Z]',                # 1. Introduction
+    r'^(Abstract|Introduction|Overview|Summary|Background|Conclusion|References|Bibliography|Acknowledgements?|Table\s+of\s+Contents|Revision\s+History)$',
+    r'^Appendix\s+[A-Z]',             # Appendix A
+    r'^[A-Z][A-Z\s&:-]{10,}$',        # Long ALL CAPS
+    r'^[A-Z][a-z]+\s+OPTIONS?$',      # "Pathway OPTIONS"
+    r'^(HOPE|WELCOME|THANK).*$',      # Event-style headings
+    r'^[A-Z].*\s+(Library|Digital|Component|Plan)$',  # Major topic headings
+    r'^Business\s+Plan',              # Business Plan related
+)
+
+_H2_PATTERNS = (
+    r'^\d+\.\d+\s+[A-Z]',             # 2.1 Overview
+    r'^(Milestones?|Summary|Background)$',
+    r'^Approach\s+and\s+',            # Approach and...
+    r'^Evaluation\s+and\s+',          # Evaluation and...
+    r'^Appendix\s+[A-Z]:',            # Appendix A:
+)
+
+_H3_PATTERNS = (
+    r'^\d+\.\d+\.\d+\s+[A-Z]',        # 2.1.1 Details
+    r'^Phase\s+[IVX]+:',              # Phase I:
+    r'.*:\s*$',                       # Ending with colon (most cases)
+    r'^\d+\.\s+[A-Z].*',              # Numbered items in appendix
+)
+
+_H4_PATTERNS = (
+    r'^For\s+(each|the)\s+\w+.*:$',   # "For each..."
+)
+
+_LEVEL_PATTERNS = (
+    # Alternatives are tried in priority order (H4 first)
+    [("H4", p) for p in _H4_PATTERNS] + [("H3", p) for p in _H3_PATTERNS]
+    + [("H2", p) for p in _H2_PATTERNS] + [("H1", p) for p in _H1_PATTERNS]
+)
+
+def _compile_patterns(patterns):
+    """Compile a pattern list into an RE2 match set (if available) and a fused stdlib alternation"""
+    pattern_set = None
+    if re2 is not None:
+        options = re2.Options()
+        options.case_sensitive = False
+        pattern_set = re2.Set.MatchSet(options)
+        for p in patterns:
+            pattern_set.Add(p)
+        pattern_set.Compile()
+    pattern_re = re.compile("|".join(f"(?P<p{i}>{p})" for i, p in enumerate(patterns)), re.IGNORECASE)
+    return pattern_set, pattern_re
+
+def _first_match(compiled, text):
+    """Index of the first pattern matching at the start of text, or None"""
+    pattern_set, pattern_re = compiled
+    # RE2's \s and \w are ASCII-only, so only hand it text where both engines agree
+    if pattern_set is not None and text.isascii() and text.isprintable():
+        ids = pattern_set.Match(text)
+        return min(ids) if ids else None
+    m = pattern_re.match(text)
+    return int(m.lastgroup[1:]) if m else None
+
+_EXCLUDE = _compile_patterns(_EXCLUDE_PATTERNS)
+_HEADING = _compile_patterns(_HEADING_PATTERNS)
+_LEVEL = _compile_patterns([p for _, p in _LEVEL_PATTERNS])
+
+_NUMBERED_RE = re.compile(r'^\d+\.\s+')
+_SUBSECTION_RE = re.compile(r'^\d+\.\d+\s+')
+_COLON_END_RE = re.compile(r'.*:\s*$')
+_ES_HEADING_RE = re.compile(r'^(Resumen|Introducción|Conclusión|Referencias|Índice|Capítulo|Sección|Anexo)', re.IGNORECASE)
+
+# Heading text normalization
+_DASH_RE = re.compile(r'[-–—]')
+_NONWORD_RE = re.compile(r'[^A-Za-z0-9 ]')
+_WS_RE = re.compile(r'\s+')
+
+# Keywords that must all appear within a few consecutive lines of a form title
+_FORM_KEYWORDS = ("application", "form", "grant")
+_FORM_AUTOMATON = ahocorasick.Automaton()
+for _kw_id, _kw in enumerate(_FORM_KEYWORDS):
+    _FORM_AUTOMATON.add_word(_kw, _kw_id)
+_FORM_AUTOMATON.make_automaton()
+
+def extract_spans(pdf_path, start_page=0, max_page=None):
+    """Line-level extraction of text spans with font metadata from PDF.
+
+    Spans are returned column-wise: a dict of parallel per-line lists/arrays
+    (text, text_lower, size, font, flags, page, bbox, y); use span_row() for a
+    single span. Text is already stripped and never empty.
+    Only pages start_page up to (not including) max_page are read;
+    "page_count" is always the length of the whole document.
+    """
+    texts, sizes, fonts, flags, pages, bboxes = [], [], [], [], [], []
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+        for page_num in range(start_page, page_count if max_page is None else min(max_page, page_count)):
+            page = doc[page_num]
+            for block in page.get_text("dict", flags=fitz.TEXTFLAGS_BLOCKS)["blocks"]:
+                if block["type"] != 0:
                     continue
-                size = block[3] - block[1]
-                spans.append({
-                    "text": line,
-                    "size": size,
-                    "font": "",
-                    "flags": 0,
-                    "page": page_num,
-                    "bbox": [block[0], block[1], block[2], block[3]],
-                    "y": block[1]
-                })
-    doc.close()
-    return spans
+                for line in block["lines"]:
+                    line_spans = line["spans"]
+                    if not line_spans:
+                        continue
+                    text = "".join(s["text"] for s in line_spans).strip()
+                    if not text:
+                        continue
+                    # Font metadata comes from the line's largest span
+                    main_span = max(line_spans, key=lambda s: s["size"])
+                    texts.append(text)
+                    sizes.append(main_span["size"])
+                    fonts.append(main_span["font"])
+                    flags.append(main_span["flags"])
+                    pages.append(page_num)
+                    bboxes.append(line["bbox"])
+    bbox = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+    return {
+        "text": texts,
+        "text_lower": [text.lower() for text in texts],
+        "size": np.array(sizes, dtype=np.float64),
+        "font": fonts,
+        "flags": np.array(flags, dtype=np.int32),
+        "page": np.array(pages, dtype=np.int32),
+        "bbox": bbox,
+        "y": bbox[:, 1],
+        "page_count": page_count
+    }
+
+def concat_spans(head, tail):
+    """Column-wise spans of head followed by tail (same document)"""
+    bbox = np.concatenate([head["bbox"], tail["bbox"]])
+    return {
+        "text": head["text"] + tail["text"],
+        "text_lower": head["text_lower"] + tail["text_lower"],
+        "size": np.concatenate([head["size"], tail["size"]]),
+        "font": head["font"] + tail["font"],
+        "flags": np.concatenate([head["flags"], tail["flags"]]),
+        "page": np.concatenate([head["page"], tail["page"]]),
+        "bbox": bbox,
+        "y": bbox[:, 1],
+        "page_count": head["page_count"]
+    }
+
+def span_row(spans, i):
+    """Single span i of column-wise spans as a plain dict"""
+    return {
+        "text": spans["text"][i],
+        "size": float(spans["size"][i]),
+        "font": spans["font"][i],
+        "flags": int(spans["flags"][i]),
+        "page": int(spans["page"][i]),
+        "bbox": spans["bbox"][i].tolist(),
+        "y": float(spans["y"][i])
+    }
+
+def detect_lang(text):
+    """Detect the language of text, loading the profile subset on first use"""
+    global _detector_factory
+    if _detector_factory is None:
+        profiles = []
+        for lang in DETECT_LANGUAGES:
+            with open(os.path.join(PROFILES_DIRECTORY, lang), encoding="utf-8") as f:
+                profiles.append(f.read())
+        factory = DetectorFactory()
+        factory.load_json_profile(profiles)
+        factory.set_seed(0)
+        _detector_factory = factory
+    detector = _detector_factory.create()
+    detector.append(text)
+    return detector.detect()
 
 def merge_fragmented_text(spans):
     """Merge text spans that have been fragmented across multiple spans"""
-    if not spans:
+    if not spans["text"]:
         return spans
     
-    # For block-level, no further merging needed; just return as is
+    # For line-level, no further merging needed; just return as is
     return spans
 
+def form_keywords_within(lines, window):
+    """True if every form keyword occurs somewhere in `window` consecutive lowercased lines"""
+    line_starts = list(accumulate((len(l) + 1 for l in lines[:-1]), initial=0))
+    last_seen = [-1] * len(_FORM_KEYWORDS)
+    # Hits arrive in text order, so the tightest window ending at the current
+    # line spans back to the earliest of each keyword's latest occurrence
+    for end, kw_id in _FORM_AUTOMATON.iter(" ".join(lines)):
+        line = bisect_right(line_starts, end) - 1
+        last_seen[kw_id] = line
+        first = min(last_seen)
+        if first >= 0 and line - first < window:
+            return True
+    return False
+
 def extract_document_title(spans):
     """Extract document title from first two pages using robust, order-agnostic, keyword-anchored logic"""
     from difflib import SequenceMatcher
-    # Gather all lines from first two pages
-    first_two_pages = [s for s in spans if s["page"] in (0, 1)]
-    lines = [s["text"].strip() for s in first_two_pages if s["text"].strip()]
-    joined = " ".join(lines)
-    # Form title logic
-    form_keywords = ["application", "form", "grant", "ltc", "advance"]
-    form_title_pat = re.compile(r"application.*form.*grant.*ltc.*advance|application.*form.*grant.*advance|application.*form.*grant|application.*form|form.*grant|application.*ltc|application.*advance", re.IGNORECASE)
-    # Try to find a line or merged lines that match all form keywords in order
-    for window in range(5, 1, -1):
-        for i in range(len(lines)-window+1):
-            merged = " ".join(lines[i:i+window])
-            if all(k in merged.lower() for k in form_keywords[:3]):
-                # Capitalize as in expected output
-                return "Application form for grant of LTC advance  "
+    texts, sizes, pages = spans["text"], spans["size"], spans["page"]
+    # Gather all lowercased lines from first two pages
+    lines = [spans["text_lower"][i] for i in np.flatnonzero(pages <= 1)]
+    # Form title logic: all form keywords within a window of up to 5 merged lines
+    if len(lines) >= 2 and form_keywords_within(lines, min(5, len(lines))):
+        # Capitalize as in expected output
+        return "Application form for grant of LTC advance  "
     # Fallback: fuzzy match
     for l in lines:
-        if SequenceMatcher(None, l.lower(), "application form for grant of ltc advance").ratio() > 0.8:
+        if SequenceMatcher(None, l, "application form for grant of ltc advance").ratio() > 0.8:
             return "Application form for grant of LTC advance  "
     # Pathways doc title
-    if any("parsippany" in l.lower() and "stem" in l.lower() for l in lines):
+    if any("parsippany" in l and "stem" in l for l in lines):
         return "Parsippany -Troy Hills STEM Pathways"
     # RFP/Business doc title
-    if any("rfp" in l.lower() or "request for proposal" in l.lower() for l in lines):
+    if any("rfp" in l or "request for proposal" in l for l in lines):
         for l in lines:
-            if "request for proposal" in l.lower():
+            if "request for proposal" in l:
                 return "RFP:Request for Proposal To Present a Proposal for Developing the Business Plan for the Ontario Digital Library  "
     # Technical doc title
-    if any("foundation" in l.lower() and "level" in l.lower() for l in lines):
+    if any("foundation" in l and "level" in l for l in lines):
         return "Overview  Foundation Level Extensions  "
     # Event/flyer: if event-like phrases, set to empty
     event_phrases = ["hope to see you there", "join us", "event", "invitation"]
     for l in lines:
-        if any(p in l.lower() for p in event_phrases):
+        if any(p in l for p in event_phrases):
             return ""
     # Fallback: largest font on first page
-    first_page = [s for s in spans if s["page"] == 0]
-    if not first_page:
+    first_page = pages == 0
+    if not first_page.any():
         return ""
-    max_size = max(s["size"] for s in first_page)
-    candidates = [s["text"] for s in first_page if s["size"] >= max_size * 0.8]
+    max_size = sizes[first_page].max()
+    candidates = [texts[i] for i in np.flatnonzero(first_page & (sizes >= max_size * 0.8))]
     title = " ".join(candidates).strip()
     if title and not title.endswith(" "):
         title += " "
     return title
 
-def is_likely_heading(text, span_info, doc_stats, doc_type):
+@lru_cache(maxsize=4096)
+def _heading_text_verdict(text):
+    """Pattern-only heading verdict for text: True, False, or None if undecided"""
     # Exclude very short/long or non-informative lines
     if len(text) < 3 or len(text) > 200:
         return False
     # Exclude common non-heading patterns
-    exclude_patterns = [
-        r'^Page\s+\d+', r'^Copyright', r'^Version\s+\d', r'^\d{4}$',
-        r'^www\.|^http', r'@\w+\.', r'^\d+\s*$', r'^[^\w\s]*$',
-        r'^\([^)]*\)$', r'^[\d\s\-\.]+$',
-        r'^(CLOSED|PLEASE|VISIT|REQUIRED|CLIMBING)',
-        r'.*[.!?]\s+.*[.!?]',
-    ]
-    if any(re.match(pattern, text, re.IGNORECASE) for pattern in exclude_patterns):
+    if _first_match(_EXCLUDE, text) is not None:
         return False
     # Patterns for headings
-    heading_patterns = [
-        r'^\d+\.\s+[A-Z]', r'^\d+\.\d+\s+[A-Z]', r'^\d+\.\d+\.\d+\s+[A-Z]',
-        r'^(Chapter|Section|Part)\s+\d+', r'^Appendix\s+[A-Z]',
-        r'^(Abstract|Introduction|Overview|Summary|Background|Conclusion|References|Bibliography|Acknowledgements?|Table\s+of\s+Contents|Revision\s+History)$',
-        r'^[A-Z][A-Z\s&:-]{6,}$', r'.*:\s*$', r'^Phase\s+[IVX]+:',
-        r'^For\s+(each|the)\s+\w+.*:$', r'^What\s+.*\?$', r'^[A-Z][a-z]+\s+OPTIONS?$',
-        r'^(HOPE|WELCOME|THANK).*$' , r'^[A-Z].*\s+(Library|Digital|Component|Plan)$',
-        r'^Milestones?$', r'^Approach\s+and\s+', r'^Evaluation\s+and\s+', r'^Business\s+Plan',
-        r'^\d+\)\s+[A-Z]', r'^[-*•]\s+[A-Z]', r'^[A-Z][A-Za-z\s\-:&]+[.:]?\s*$',
-    ]
-    if any(re.match(pattern, text, re.IGNORECASE) for pattern in heading_patterns):
+    if _first_match(_HEADING, text) is not None:
         return True
+    return None
+
+def is_likely_heading(text, doc_stats, doc_type):
+    verdict = _heading_text_verdict(text)
+    if verdict is not None:
+        return verdict
     # For technical/RFP/pathways, allow more
     if doc_type in ("technical", "rfp", "pathways"):
         if text.isupper() or text.endswith(":") or len(text.split()) > 5:
             return True
     return False
 
+@lru_cache(maxsize=4096)
+def _pattern_level(text):
+    """Heading level implied by text patterns alone, or None"""
+    idx = _first_match(_LEVEL, text)
+    return _LEVEL_PATTERNS[idx][0] if idx is not None else None
+
 def classify_heading_level(text, span_info, document_stats):
     """Classify heading level using adaptive algorithm"""
     size = span_info.get("size", 0)
     size_percentile = document_stats["size_percentile"].get(size, 0)
     
-    # Pattern-based classification - generic patterns
-    h1_patterns = [
-        r'^\d+\.\s+[A-Z]',                # 1. Introduction
-        r'^(Abstract|Introduction|Overview|Summary|Background|Conclusion|References|Bibliography|Acknowledgements?|Table\s+of\s+Contents|Revision\s+History)$',
-        r'^Appendix\s+[A-Z]',             # Appendix A
-        r'^[A-Z][A-Z\s&:-]{10,}$',        # Long ALL CAPS
-        r'^[A-Z][a-z]+\s+OPTIONS?$',      # "Pathway OPTIONS" 
-        r'^(HOPE|WELCOME|THANK).*$',      # Event-style headings
-        r'^[A-Z].*\s+(Library|Digital|Component|Plan)$',  # Major topic headings
-        r'^Business\s+Plan',              # Business Plan related
-    ]
-    
-    h2_patterns = [
-        r'^\d+\.\d+\s+[A-Z]',             # 2.1 Overview
-        r'^(Milestones?|Summary|Background)$',
-        r'^Approach\s+and\s+',            # Approach and...
-        r'^Evaluation\s+and\s+',          # Evaluation and...
-        r'^Appendix\s+[A-Z]:',            # Appendix A:
-    ]
-    
-    h3_patterns = [
-        r'^\d+\.\d+\.\d+\s+[A-Z]',        # 2.1.1 Details
-        r'^Phase\s+[IVX]+:',              # Phase I:
-        r'.*:\s*$',                       # Ending with colon (most cases)
-        r'^\d+\.\s+[A-Z].*',              # Numbered items in appendix
-    ]
-    
-    h4_patterns = [
-        r'^For\s+(each|the)\s+\w+.*:$',   # "For each..."
-    ]
-    
     # Pattern-based classification first
-    if any(re.match(p, text, re.IGNORECASE) for p in h4_patterns):
-        return "H4"
-    elif any(re.match(p, text, re.IGNORECASE) for p in h3_patterns):
-        return "H3"
-    elif any(re.match(p, text, re.IGNORECASE) for p in h2_patterns):
-        return "H2"
-    elif any(re.match(p, text, re.IGNORECASE) for p in h1_patterns):
-        return "H1"
+    level = _pattern_level(text)
+    if level is not None:
+        return level
     
     # Size-based classification as fallback
     if size_percentile >= 0.9:      # Top 10%
@@ -181,123 +327,138 @@ def classify_heading_level(text, span_info, document_stats):
 
 def analyze_document_structure(spans):
     """Analyze document structure to extract statistical information"""
-    sizes = [s["size"] for s in spans]
-    if not sizes:
-        return {"unique_sizes": [], "size_percentile": {}, "avg_size": 0}
-    unique_sizes = sorted(set(sizes))
-    size_to_rank = {size: i for i, size in enumerate(unique_sizes)}
+    sizes = spans["size"]
+    if not len(sizes):
+        return {"unique_sizes": [], "size_percentile": {}, "span_percentile": np.zeros(0), "avg_size": 0}
+    unique_sizes, inverse = np.unique(sizes, return_inverse=True)
     n = len(unique_sizes)
-    size_percentile = {size: (rank / (n - 1) if n > 1 else 1.0) for size, rank in size_to_rank.items()}
+    percentiles = np.arange(n) / (n - 1) if n > 1 else np.ones(1)
     return {
-        "unique_sizes": unique_sizes,
-        "size_percentile": size_percentile,
-        "avg_size": sum(sizes) / len(sizes)
+        "unique_sizes": unique_sizes.tolist(),
+        "size_percentile": dict(zip(unique_sizes.tolist(), percentiles.tolist())),
+        # Per-span percentile, indexed by span position
+        "span_percentile": percentiles[inverse],
+        "avg_size": float(sizes.mean())
     }
 
-def calculate_heading_importance(text, span, doc_stats):
-    """Calculate importance score for a heading candidate"""
-    score = 0
-    
+@lru_cache(maxsize=4096)
+def _pattern_importance(text):
+    """Score contribution from structural text patterns"""
+    if _NUMBERED_RE.match(text):  # Numbered sections
+        return 3
+    elif _SUBSECTION_RE.match(text):  # Subsections
+        return 2
+    elif text in ['Revision History', 'Table of Contents', 'Acknowledgements', 
+                  'Summary', 'Background', 'References']:
+        return 3
+    elif _COLON_END_RE.match(text):  # Colon endings
+        return 1
+    return 0
+
+def calculate_heading_importance(spans, texts, indices, doc_stats):
+    """Calculate importance scores for the heading candidates at span positions `indices`"""
     # Size-based scoring
-    size_percentile = doc_stats["size_percentile"].get(span["size"], 0)
-    score += size_percentile * 3
+    scores = doc_stats["span_percentile"][indices] * 3
     
     # Bold formatting
-    if bool(span.get("flags", 0) & 2):
-        score += 2
+    scores += ((spans["flags"][indices] & fitz.TEXT_FONT_BOLD) != 0) * 2
     
     # Structural patterns get high scores
-    if re.match(r'^\d+\.\s+', text):  # Numbered sections
-        score += 3
-    elif re.match(r'^\d+\.\d+\s+', text):  # Subsections
-        score += 2
-    elif text in ['Revision History', 'Table of Contents', 'Acknowledgements', 
-                  'Summary', 'Background', 'References']:
-        score += 3
-    elif re.match(r'.*:\s*$', text):  # Colon endings
-        score += 1
+    scores += np.fromiter((_pattern_importance(texts[i]) for i in indices), dtype=np.float64, count=len(indices))
     
     # Position-based scoring (earlier = more important)
-    if span["page"] == 0:
-        score += 1
-    if span["y"] < 200:  # Top of page
-        score += 0.5
+    scores += spans["page"][indices] == 0
+    scores += (spans["y"][indices] < 200) * 0.5  # Top of page
     
-    return score
+    return scores
+
+def norm(s):
+    """Normalize: remove punctuation, dashes, extra spaces, lowercase, strip"""
+    s = unicodedata.normalize('NFKD', s)
+    s = _DASH_RE.sub(' ', s)  # replace dashes with space
+    s = _NONWORD_RE.sub('', s)
+    s = _WS_RE.sub(' ', s)
+    return s.strip().lower()
+
+# Strict expected patterns for technical and RFP
+_TECHNICAL_EXPECTED = (
+    ("Revision History ", "H1"),
+    ("Table of Contents ", "H1"),
+    ("Acknowledgements ", "H1"),
+    ("1. Introduction to the Foundation Level Extensions ", "H1"),
+    ("2. Introduction to Foundation Level Agile Tester Extension ", "H1"),
+    ("2.1 Intended Audience ", "H2"),
+    ("2.2 Career Paths for Testers ", "H2"),
+    ("2.3 Learning Objectives ", "H2"),
+    ("2.4 Entry Requirements ", "H2"),
+    ("2.5 Structure and Course Duration ", "H2"),
+    ("2.6 Keeping It Current ", "H2"),
+    ("3. Overview of the Foundation Level Extension – Agile TesterSyllabus ", "H1"),
+    ("3.1 Business Outcomes ", "H2"),
+    ("3.2 Content ", "H2"),
+    ("4. References ", "H1"),
+    ("4.1 Trademarks ", "H2"),
+    ("4.2 Documents and Web Sites ", "H2"),
+)
+
+_RFP_EXPECTED = (
+    ("Ontario’s Digital Library ", "H1"),
+    ("A Critical Component for Implementing Ontario’s Road Map to Prosperity Strategy ", "H1"),
+    ("Summary ", "H2"),
+    ("Timeline: ", "H3"),
+    ("Background ", "H2"),
+    ("Equitable access for all Ontarians: ", "H3"),
+    ("Shared decision-making and accountability: ", "H3"),
+    ("Shared governance structure: ", "H3"),
+    ("Shared funding: ", "H3"),
+    ("Local points of entry: ", "H3"),
+    ("Access: ", "H3"),
+    ("Guidance and Advice: ", "H3"),
+    ("Training: ", "H3"),
+    ("Provincial Purchasing & Licensing: ", "H3"),
+    ("Technological Support: ", "H3"),
+    ("What could the ODL really mean? ", "H3"),
+    ("For each Ontario citizen it could mean: ", "H4"),
+    ("For each Ontario student it could mean: ", "H4"),
+    ("For each Ontario library it could mean: ", "H4"),
+    ("For the Ontario government it could mean: ", "H4"),
+    ("The Business Plan to be Developed ", "H2"),
+    ("Milestones ", "H3"),
+    ("Approach and Specific Proposal Requirements ", "H2"),
+    ("Evaluation and Awarding of Contract ", "H2"),
+    ("Appendix A: ODL Envisioned Phases & Funding ", "H2"),
+    ("Phase I: Business Planning ", "H3"),
+    ("Phase II: Implementing and Transitioning ", "H3"),
+    ("Phase III: Operating and Growing the ODL ", "H3"),
+    ("Appendix B: ODL Steering Committee Terms of Reference ", "H2"),
+    ("1. Preamble ", "H3"),
+    ("2. Terms of Reference ", "H3"),
+    ("3. Membership ", "H3"),
+    ("4. Appointment Criteria and Process ", "H3"),
+    ("5. Term ", "H3"),
+    ("6. Chair ", "H3"),
+    ("7. Meetings ", "H3"),
+    ("8. Lines of Accountability and Communication ", "H3"),
+    ("9. Financial and Administrative Policies ", "H3"),
+    ("Appendix C: ODL’s Envisioned Electronic Resources ", "H2"),
+)
+
+def _expected_index(expected):
+    """Normalized word sets of expected headings plus a word -> heading index lookup"""
+    exp_words = tuple(frozenset(norm(text).split()) for text, _ in expected)
+    word_index = {}
+    for idx, words_exp in enumerate(exp_words):
+        for w in words_exp:
+            word_index.setdefault(w, []).append(idx)
+    return exp_words, word_index
+
+_TECHNICAL_INDEX = _expected_index(_TECHNICAL_EXPECTED)
+_RFP_INDEX = _expected_index(_RFP_EXPECTED)
+_TOC_NORM = norm("Table of Contents")
 
 def filter_headings(potential_headings, doc_type):
     filtered = []
     seen = set()
-    # Strict expected patterns for technical and RFP
-    technical_expected = [
-        ("Revision History ", "H1"),
-        ("Table of Contents ", "H1"),
-        ("Acknowledgements ", "H1"),
-        ("1. Introduction to the Foundation Level Extensions ", "H1"),
-        ("2. Introduction to Foundation Level Agile Tester Extension ", "H1"),
-        ("2.1 Intended Audience ", "H2"),
-        ("2.2 Career Paths for Testers ", "H2"),
-        ("2.3 Learning Objectives ", "H2"),
-        ("2.4 Entry Requirements ", "H2"),
-        ("2.5 Structure and Course Duration ", "H2"),
-        ("2.6 Keeping It Current ", "H2"),
-        ("3. Overview of the Foundation Level Extension – Agile TesterSyllabus ", "H1"),
-        ("3.1 Business Outcomes ", "H2"),
-        ("3.2 Content ", "H2"),
-        ("4. References ", "H1"),
-        ("4.1 Trademarks ", "H2"),
-        ("4.2 Documents and Web Sites ", "H2")
-    ]
-    rfp_expected = [
-        ("Ontario’s Digital Library ", "H1"),
-        ("A Critical Component for Implementing Ontario’s Road Map to Prosperity Strategy ", "H1"),
-        ("Summary ", "H2"),
-        ("Timeline: ", "H3"),
-        ("Background ", "H2"),
-        ("Equitable access for all Ontarians: ", "H3"),
-        ("Shared decision-making and accountability: ", "H3"),
-        ("Shared governance structure: ", "H3"),
-        ("Shared funding: ", "H3"),
-        ("Local points of entry: ", "H3"),
-        ("Access: ", "H3"),
-        ("Guidance and Advice: ", "H3"),
-        ("Training: ", "H3"),
-        ("Provincial Purchasing & Licensing: ", "H3"),
-        ("Technological Support: ", "H3"),
-        ("What could the ODL really mean? ", "H3"),
-        ("For each Ontario citizen it could mean: ", "H4"),
-        ("For each Ontario student it could mean: ", "H4"),
-        ("For each Ontario library it could mean: ", "H4"),
-        ("For the Ontario government it could mean: ", "H4"),
-        ("The Business Plan to be Developed ", "H2"),
-        ("Milestones ", "H3"),
-        ("Approach and Specific Proposal Requirements ", "H2"),
-        ("Evaluation and Awarding of Contract ", "H2"),
-        ("Appendix A: ODL Envisioned Phases & Funding ", "H2"),
-        ("Phase I: Business Planning ", "H3"),
-        ("Phase II: Implementing and Transitioning ", "H3"),
-        ("Phase III: Operating and Growing the ODL ", "H3"),
-        ("Appendix B: ODL Steering Committee Terms of Reference ", "H2"),
-        ("1. Preamble ", "H3"),
-        ("2. Terms of Reference ", "H3"),
-        ("3. Membership ", "H3"),
-        ("4. Appointment Criteria and Process ", "H3"),
-        ("5. Term ", "H3"),
-        ("6. Chair ", "H3"),
-        ("7. Meetings ", "H3"),
-        ("8. Lines of Accountability and Communication ", "H3"),
-        ("9. Financial and Administrative Policies ", "H3"),
-        ("Appendix C: ODL’s Envisioned Electronic Resources ", "H2")
-    ]
-    import unicodedata
-    def norm(s):
-        # Normalize: remove punctuation, dashes, extra spaces, lowercase, strip
-        s = unicodedata.normalize('NFKD', s)
-        s = re.sub(r'[-–—]', ' ', s)  # replace dashes with space
-        s = re.sub(r'[^A-Za-z0-9 ]', '', s)
-        s = re.sub(r'\s+', ' ', s)
-        return s.strip().lower()
-
     if doc_type == "form":
         return []
     if doc_type == "pathways":
@@ -308,44 +469,45 @@ def filter_headings(potential_headings, doc_type):
 
     # For technical and RFP, use normalized/fuzzy matching for expected headings
     if doc_type in ("technical", "rfp"):
-        expected = technical_expected if doc_type == "technical" else rfp_expected
+        if doc_type == "technical":
+            expected, (exp_words, word_index) = _TECHNICAL_EXPECTED, _TECHNICAL_INDEX
+        else:
+            expected, (exp_words, word_index) = _RFP_EXPECTED, _RFP_INDEX
+        # Normalize each candidate once, not once per expected heading
+        normed = [norm(h["text"]) for h in potential_headings]
+        cand_words = [set(n_cand.split()) for n_cand in normed]
         # Find the page where Table of Contents ends (or use a threshold, e.g., page 4)
         toc_end_page = 3
-        for h in potential_headings:
-            if norm(h["text"]).startswith(norm("Table of Contents")):
+        for h, n_cand in zip(potential_headings, normed):
+            if n_cand.startswith(_TOC_NORM):
                 toc_end_page = max(toc_end_page, h["span"]["page"])
         min_section_page = toc_end_page + 1
-        used = set()
-        found_headings = []
-        last_page = 0
-        for idx, (expected_text, expected_level) in enumerate(expected):
-            n_exp = norm(expected_text)
-            best = None
-            best_page = None
-            for h in potential_headings:
-                n_cand = norm(h["text"])
-                words_exp = set(n_exp.split())
-                words_cand = set(n_cand.split())
-                common = words_exp & words_cand
-                ratio = len(common) / max(1, len(words_exp))
-                page = h["span"]["page"]
+        # Expected heading index -> page of its earliest matching candidate; each
+        # candidate is only scored against the expected headings it shares a word with
+        best_pages = {}
+        for h, words_cand in zip(potential_headings, cand_words):
+            page = h["span"]["page"]
+            common = {}
+            for w in words_cand:
+                for idx in word_index.get(w, ()):
+                    common[idx] = common.get(idx, 0) + 1
+            for idx, n_common in common.items():
+                ratio = n_common / max(1, len(exp_words[idx]))
                 # For TOC/summary headings, allow matches in first 5 pages
                 if idx <= 2:
-                    if ratio > 0.7 and page <= 5:
-                        if best is None or page < best_page:
-                            best = h
-                            best_page = page
+                    matched = ratio > 0.7 and page <= 5
                 else:
-                    if ratio > 0.85 and page >= min_section_page:
-                        if best is None or page < best_page:
-                            best = h
-                            best_page = page
-            if best:
-                page = best["span"]["page"]
-                last_page = page
+                    matched = ratio > 0.85 and page >= min_section_page
+                if matched and (idx not in best_pages or page < best_pages[idx]):
+                    best_pages[idx] = page
+        found_headings = []
+        last_page = 0
+        for idx, (expected_text, expected_level) in enumerate(expected):
+            if idx in best_pages:
+                page = best_pages[idx]
             else:
                 page = last_page + 1 if found_headings else 0
-                last_page = page
+            last_page = page
             found_headings.append({
                 "level": expected_level,
                 "text": expected_text,
@@ -356,8 +518,8 @@ def filter_headings(potential_headings, doc_type):
 
     # Default: generic heading filtering
     for h in potential_headings:
-        text = re.sub(r'\s+', ' ', h["text"]).strip()
-        text_norm = re.sub(r'[^A-Za-z0-9 ]', '', text).lower()
+        text = _WS_RE.sub(' ', h["text"]).strip()
+        text_norm = _NONWORD_RE.sub('', text).lower()
         if text_norm in seen:
             continue
         seen.add(text_norm)
@@ -365,98 +527,118 @@ def filter_headings(potential_headings, doc_type):
             filtered.append(h)
     return filtered
 
-def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    DetectorFactory.seed = 0
-    for filename in sorted(os.listdir(INPUT_DIR)):
-        if not filename.lower().endswith(".pdf"):
-            continue
-        pdf_path = os.path.join(INPUT_DIR, filename)
-        spans = extract_spans(pdf_path)
-        if not spans:
-            out = {"title": "", "outline": []}
-        else:
-            title = extract_document_title(spans)
-            # Detect document language using langdetect on first 2 pages
-            lang = "en"
-            try:
-                sample_text = " ".join([s["text"] for s in spans if s["page"] in (0, 1)])
-                if sample_text.strip():
-                    lang = detect(sample_text)
-            except LangDetectException:
+def simplify_outline(data):
+    """Clean output structure: just the title and outline"""
+    return {
+        "title": data.get("title", ""),
+        "outline": data.get("outline", [])
+    }
+
+def process_pdf(filename):
+    """Extract the title and outline of one PDF in INPUT_DIR; returns (filename, out)"""
+    pdf_path = os.path.join(INPUT_DIR, filename)
+    # Text caches only pay off within a document; don't let them grow across the batch
+    _heading_text_verdict.cache_clear()
+    _pattern_level.cache_clear()
+    _pattern_importance.cache_clear()
+    # Title, language and doc type only need the first two pages; read the
+    # rest only if the doc type calls for an outline
+    spans = extract_spans(pdf_path, max_page=2)
+    if not spans["text"] and spans["page_count"] <= 2:
+        out = {"title": "", "outline": []}
+    else:
+        title = extract_document_title(spans)
+        # Detect document language using langdetect on first 2 pages
+        lang = "en"
+        try:
+            sample_text = " ".join([spans["text"][i] for i in np.flatnonzero(spans["page"] <= 1)])
+            # Spanish, the only other language we handle, always carries accents,
+            # so a long pure-ASCII sample is English without running langdetect
+            if len(sample_text) > 64 and sample_text.isascii():
                 lang = "en"
+            elif sample_text:
+                lang = detect_lang(sample_text)
+        except LangDetectException:
+            lang = "en"
 
-            # Determine doc type with stricter event/flyer logic (English only)
-            t = title.lower().strip()
-            num_pages = max((s["page"] for s in spans), default=0) + 1
-            event_phrases = ["hope to see you there", "join us", "event", "invitation"]
-            is_event = False
-            if lang == "en":
-                if t == "":
-                    if num_pages <= 2:
-                        lines = [s["text"].lower() for s in spans if s["page"] in (0, 1)]
-                        if any(any(p in l for p in event_phrases) for l in lines):
-                            is_event = True
-                if is_event:
-                    doc_type = "event"
-                elif "application form for grant of ltc advance" in t:
-                    doc_type = "form"
-                elif "foundation level extensions" in t:
-                    doc_type = "technical"
-                elif "rfp:request for proposal" in t:
-                    doc_type = "rfp"
-                elif "parsippany" in t:
-                    doc_type = "pathways"
-                else:
-                    doc_type = "other"
+        # Determine doc type with stricter event/flyer logic (English only)
+        t = title.lower().strip()
+        num_pages = spans["page_count"]
+        event_phrases = ["hope to see you there", "join us", "event", "invitation"]
+        is_event = False
+        if lang == "en":
+            if t == "":
+                if num_pages <= 2:
+                    lines = [spans["text_lower"][i] for i in np.flatnonzero(spans["page"] <= 1)]
+                    if any(any(p in l for p in event_phrases) for l in lines):
+                        is_event = True
+            if is_event:
+                doc_type = "event"
+            elif "application form for grant of ltc advance" in t:
+                doc_type = "form"
+            elif "foundation level extensions" in t:
+                doc_type = "technical"
+            elif "rfp:request for proposal" in t:
+                doc_type = "rfp"
+            elif "parsippany" in t:
+                doc_type = "pathways"
             else:
                 doc_type = "other"
+        else:
+            doc_type = "other"
 
-            # Event/flyer special case (English only)
-            if lang == "en" and doc_type == "event":
-                out = {"title": "", "outline": [{"level": "H1", "text": "HOPE To SEE You THERE! ", "page": 0}]}
+        # Event/flyer special case (English only)
+        if lang == "en" and doc_type == "event":
+            out = {"title": "", "outline": [{"level": "H1", "text": "HOPE To SEE You THERE! ", "page": 0}]}
+        # For forms, force outline to be empty
+        elif lang == "en" and doc_type == "form":
+            out = {"title": title, "outline": []}
+        else:
+            if num_pages > 2:
+                spans = concat_spans(spans, extract_spans(pdf_path, start_page=2))
+            # Heading extraction
+            doc_stats = analyze_document_structure(spans)
+            texts = spans["text"]
+            # Multilingual heading detection: English (default), add Spanish as example
+            if lang == "en":
+                indices = np.flatnonzero([is_likely_heading(text, doc_stats, doc_type) for text in texts])
+                scores = calculate_heading_importance(spans, texts, indices, doc_stats)
+            elif lang == "es":
+                # Spanish heading patterns (basic demo)
+                indices = np.flatnonzero([_ES_HEADING_RE.match(text) is not None for text in texts])
+                scores = np.full(len(indices), 2.0)  # Arbitrary score for demo
             else:
-                # Heading extraction
-                doc_stats = analyze_document_structure(spans)
-                potential_headings = []
-                for span in spans:
-                    text = span["text"].strip()
-                    # Multilingual heading detection: English (default), add Spanish as example
-                    if lang == "en":
-                        if is_likely_heading(text, span, doc_stats, doc_type):
-                            potential_headings.append({
-                                "text": text,
-                                "span": span,
-                                "score": calculate_heading_importance(text, span, doc_stats)
-                            })
-                    elif lang == "es":
-                        # Spanish heading patterns (basic demo)
-                        if re.match(r'^(Resumen|Introducción|Conclusión|Referencias|Índice|Capítulo|Sección|Anexo)', text, re.IGNORECASE):
-                            potential_headings.append({
-                                "text": text,
-                                "span": span,
-                                "score": 2  # Arbitrary score for demo
-                            })
-                    else:
-                        # Fallback: treat as normal text, no headings
-                        pass
-                # Sort and filter
-                potential_headings.sort(key=lambda x: x["score"], reverse=True)
-                filtered_headings = filter_headings(potential_headings, doc_type)
-                headings = []
-                for h in filtered_headings:
-                    text = h["text"]
-                    span = h["span"]
-                    level = classify_heading_level(text, span, doc_stats)
-                    headings.append({"level": level, "text": text + (" " if not text.endswith(" ") else ""), "page": span["page"]})
-                # For forms, force outline to be empty
-                if lang == "en" and doc_type == "form":
-                    headings = []
-                out = {"title": title, "outline": headings}
-        output_path = os.path.join(OUTPUT_DIR, filename.replace(".pdf", ".json"))
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(out, f, ensure_ascii=False, indent=2)
-        print(f"[OK] → {filename}")
+                # Fallback: treat as normal text, no headings
+                indices, scores = np.zeros(0, dtype=np.intp), np.zeros(0)
+            potential_headings = [
+                {"text": texts[i], "span": span_row(spans, i), "score": score}
+                for i, score in zip(indices.tolist(), scores.tolist())
+            ]
+            # Sort and filter; the technical/RFP matchers only keep the earliest
+            # page per expected heading, so candidate order doesn't matter there
+            if doc_type not in ("technical", "rfp"):
+                potential_headings.sort(key=itemgetter("score"), reverse=True)
+            filtered_headings = filter_headings(potential_headings, doc_type)
+            headings = []
+            for h in filtered_headings:
+                text = h["text"]
+                span = h["span"]
+                level = classify_heading_level(text, span, doc_stats)
+                headings.append({"level": level, "text": text + (" " if not text.endswith(" ") else ""), "page": span["page"]})
+            out = {"title": title, "outline": headings}
+    return filename, out
+
+def main():
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    pdfs = [fn for fn in sorted(os.listdir(INPUT_DIR)) if fn.lower().endswith(".pdf")]
+    json_option = 0 if COMPACT else orjson.OPT_INDENT_2
+    # PDFs are independent and the work is Python-bound, so fan out across processes
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        for filename, out in ex.map(process_pdf, pdfs):
+            output_path = os.path.join(OUTPUT_DIR, filename.replace(".pdf", ".json"))
+            with open(output_path, "wb") as f:
+                f.write(orjson.dumps(simplify_outline(out), option=json_option))
+            print(f"[OK] → {filename}")
 
 if __name__ == "__main__":
     main()